@@ -1,4 +1,4 @@
-import re
+import functools
 import vs
 
 # This is the connection to the DB server. More about connection strings: 
@@ -10,6 +10,12 @@ import vs
 conninfo = "Provider=SQLOLEDB;data source=.;initial catalog=Tfs_Foo;Integrated Security=SSPI"
 
 
+# Optionally, the list of TFS path prefixes to export (e.g. ["$\\PCSA2\\"]). Paths not starting with
+# one of them are already dropped by the database server, which saves transferring and evaluating
+# rows that the hooks below would ignore anyway. :None: means that all paths are considered.
+path_prefixes = None
+
+
 # This is the hook that converts a TFS path name into a (Branch, Relative-Path) pair.
 #
 # This can also be called for a branch path itself, so you have to be prepared to not find a relative
@@ -17,36 +23,41 @@ conninfo = "Provider=SQLOLEDB;data source=.;initial catalog=Tfs_Foo;Integrated S
 #
 # Returning "(None, None)" means that the file will be ignored. This can be used to filter out 
 # unwanted files, but alternatively you can configure the :file_filter: hook (see below).
+#
+# This hook is called for every single path, so prefer plain string operations over regular
+# expressions (and if you need the latter, compile them at module scope).
+_branch_prefix = "$\\PCSA2\\"
+_branch_names = {"Development", "Hotfixes", "Main", "Release"}
+
 def branch_extract(name):
 
     # a straight forward implementation (everything is included in the master branch)
     return "master", name[2:]
 
     # a more sophisticated solution, taking into account different TFS branches
-    # (be sure to move the re.compile statement to module scope.)
-    branch_re = re.compile(r"\A\$\\PCSA2\\(?P<branch>Development|Hotfixes|Main|Release)(\\(?P<relpath>.*))?\Z")
+    if not name.startswith(_branch_prefix):
+        return (None, None)
 
-    m = branch_re.match(name)
-    if not m:
+    branch, sep, relpath = name[len(_branch_prefix):].partition("\\")
+    if branch not in _branch_names:
         return (None, None)
 
-    return m.group("branch"), m.group("relpath")
+    return branch, relpath if sep else None
 
 
 # This is the hook that is immediately called after the branch_hook. This can be used 
 # in alternative to filter out files.
 #
 # Shall return False if the file is to be ignored.
+_ignored_extensions = (".bacpac", ".cspkg", ".bak")
+
 def file_filter(branch, relpath):
 
     # a straight forward implementation (everything is included)
     return True
 
     # a more sophisticated solution
-    # (be sure to move the re.compile statement to module scope.)
-    ignores_re = re.compile(r"\.(bacpac|cspkg|bak)\Z")
-
-    return vs.vs_file_filter(branch, relpath) and not ignores_re.search(relpath)
+    return vs.vs_file_filter(branch, relpath) and not relpath.endswith(_ignored_extensions)
 
 
 # This is the hook that is called to rewrite (historical) file content. 
@@ -71,14 +82,26 @@ def content_rewrite(branch, relpath, length, blocks):
 # Returning :None: as time zone means that the current machine's timezone is used.
 # Otherwise you may want to refer to the :pytz: library.
 #
-# The result of this function will be cached. So it will be only called once per
+# The result of this function will be cached by the exporter. So it will be only called once per
 # invocation and TFS user and you can do potentially expensive operations (but be aware
 # that you may receive user information that is no more present in the Active Directory).
+#
+# The actual lookup below is additionally cached per account (domain and login), so that several
+# TFS identities mapping to the same account do not trigger repeated expensive lookups. It may return
+# :None: as display name to keep the one stored in TFS.
 def user_lookup(user):
 
+    display_name, email, tz = _lookup_login(user.domain, user.login)
+
+    return (display_name or user.display_name, email, tz)
+
+
+@functools.lru_cache(maxsize = None)
+def _lookup_login(domain, login):
+
     # a straight forward implementation
-    return (user.display_name, "nobody@example.org", None)
+    return (None, "nobody@example.org", None)
 
     # a more sophisticated solution
     tmp = {'MEK': ('Kuno Meyer', 'kuno.meyer@gmx.ch', None)}
-    return tmp[user.login]
\ No newline at end of file
+    return tmp[login]
\ No newline at end of file
@@ -1,5 +1,6 @@
-﻿import re
-import stat
+﻿import stat
+
+fragment_coalesce_size = 64 * 1024
 
 class CommitCommand(object):
 
@@ -18,31 +19,33 @@ class CommitCommand(object):
         self.id = format_mark(mark) if mark else (b'@%d' % lineno)
 
     def serialize(self, stream):
-        stream.write(b"commit refs/heads/%s\n" % self.ref.encode('ascii'))
+        parts = [b"commit refs/heads/%s\n" % self.ref.encode('ascii')]
 
         if self.mark:
-            serialize_mark(stream, self.mark)
+            parts.append(b"mark %s\n" % format_mark(self.mark))
 
         if self.author:
-            stream.write(b"author %s\n" % format_who_when(self.author))
+            parts.append(b"author %s\n" % format_who_when(self.author))
         if self.more_authors:
             for author in self.more_authors:
-                stream.write(b"author %s\n" % format_who_when(author))
+                parts.append(b"author %s\n" % format_who_when(author))
 
-        stream.write(b"committer %s\n" % format_who_when(self.committer))
+        parts.append(b"committer %s\n" % format_who_when(self.committer))
 
-        serialize_data(stream, (self.message or "").encode('utf-8'))
+        parts.append(format_data((self.message or "").encode('utf-8')))
 
         if self.from_:
-            stream.write(b"from %s\n" % self.from_)
+            parts.append(b"from %s\n" % self.from_)
         if self.merges:
             for merge in self.merges:
-                stream.write(b"merge %s\n" % merge)
+                parts.append(b"merge %s\n" % merge)
 
         if self.properties:
             for name in sorted(self.properties):
                 value = self.properties[name]
-                stream.write(b"%s\n" + format_property(name, value))
+                parts.append(format_property(name, value) + b"\n")
+
+        stream.write(b"".join(parts))
 
 class ProgressCommand():
 
@@ -63,12 +66,15 @@ class TagCommand(object):
         self.message = message
 
     def serialize(self, stream):
-        stream.write(b"tag %s\nfrom %s\n" % (format_path(self.id), self.from_))
-        stream.write(b"tagger %s\n" % format_who_when(self.tagger))
-        serialize_data(stream, (self.message or "").encode('utf-8'))
+        stream.write(b"".join((
+            b"tag %s\nfrom %s\n" % (format_path(self.id), self.from_),
+            b"tagger %s\n" % format_who_when(self.tagger),
+            format_data((self.message or "").encode('utf-8')))))
 
 class FileModifyCommand(object):
 
+    __slots__ = ("path", "mode", "dataref", "data")
+
     def __init__(self, path, mode, dataref, data):
         if (dataref is None) == (data is None):
             raise Exception("please provide either dataref or data")
@@ -78,18 +84,20 @@ class FileModifyCommand(object):
         self.dataref = dataref
         self.data = data
 
-    def _format_mode(self, mode):
-        if mode in (0o755, 0o100755):
-            return b"755"
-        elif mode in (0o644, 0o100644):
-            return b"644"
-        elif mode == 0o40000:
-            return b"040000"
-        elif mode == 0o120000:
-            return b"120000"
-        elif mode == 0o160000:
-            return b"160000"
-        else:
+    _modes = {
+        0o755: b"755",
+        0o100755: b"755",
+        0o644: b"644",
+        0o100644: b"644",
+        0o40000: b"040000",
+        0o120000: b"120000",
+        0o160000: b"160000"}
+
+    @staticmethod
+    def _format_mode(mode):
+        try:
+            return FileModifyCommand._modes[mode]
+        except KeyError:
             raise AssertionError("Unknown mode %o" % mode)
 
     def serialize(self, stream):
@@ -100,12 +108,20 @@ class FileModifyCommand(object):
         else:
             dataref = b"inline"
 
-        stream.write(b"M %s %s %s\n" % (self._format_mode(self.mode), dataref, format_path(self.path)))
-        if self.data is not None:
+        line = b"".join((b"M ", self._format_mode(self.mode), b" ", dataref, b" ", format_path(self.path), b"\n"))
+
+        if self.data is None:
+            stream.write(line)
+        elif isinstance(self.data, bytes):
+            stream.write(line + format_data(self.data))
+        else:
+            stream.write(line)
             serialize_data(stream, self.data)
 
 class FileDeleteCommand(object):
 
+    __slots__ = ("path",)
+
     def __init__(self, path):
         self.path = check_path(path)
 
@@ -114,6 +130,8 @@ class FileDeleteCommand(object):
 
 class FileCopyCommand(object):
 
+    __slots__ = ("src_path", "dest_path")
+
     def __init__(self, src_path, dest_path):
         self.src_path = check_path(src_path)
         self.dest_path = check_path(dest_path)
@@ -123,6 +141,8 @@ class FileCopyCommand(object):
 
 class FileRenameCommand(object):
 
+    __slots__ = ("old_path", "new_path")
+
     def __init__(self, old_path, new_path):
         self.old_path = check_path(old_path)
         self.new_path = check_path(new_path)
@@ -132,6 +152,8 @@ class FileRenameCommand(object):
 
 class FileDeleteAllCommand(object):
 
+    __slots__ = ()
+
     def serialize(self, stream):
         stream.write(b"deleteall")
 
@@ -147,26 +169,36 @@ def check_path(path):
     :raise ValueError: if the path is illegal
     """
 
-    if path is None or path == '' or path[0] == "/":
+    if not path or path[0] == "/":
         raise ValueError("illegal path '%s'" % path)
     return path
 
 def format_path(p, quote_spaces=False):
     """Format a path in utf8, quoting it if necessary."""
 
-    if '\n' in p:
-        p = re.sub('\n', '\\n', p)
-        quote = True
-    else:
-        quote = p.startswith('"') or (quote_spaces and ' ' in p)
-    if quote:
-        p = '"' + p + '"'
-    return p.encode('utf-8')
+    # fast path for the common case of a path not needing any quotes
+    if '\n' not in p and p[:1] != '"' and not (quote_spaces and ' ' in p):
+        return p.encode('utf-8')
+
+    p = p.replace('\n', '\\n')
+    return b'"' + p.encode('utf-8') + b'"'
+
+_who_cache = {}
 
 def format_who_when(fields):
     """Format a tuple of name,email,secs-since-epoch,utc-offset-secs as a string."""
 
-    offset = fields[3]
+    key = (fields[0], fields[1], fields[3])
+
+    identity = _who_cache.get(key)
+    if identity is None:
+        identity = _who_cache[key] = _format_identity(*key)
+
+    return b'%s%d%s' % (identity[0], fields[2], identity[1])
+
+def _format_identity(name, email, offset):
+    """Format the time independent parts of a who-when tuple. Returns a (prefix, suffix) tuple."""
+
     if offset < 0:
         offset_sign = b'-'
         offset = abs(offset)
@@ -175,7 +207,6 @@ def format_who_when(fields):
     offset_hours = offset // 3600
     offset_minutes = (offset // 60) % 60
 
-    name = fields[0]
     if name.endswith(" "):
         raise ValueError("name %r ends with space" % name)
     if len(name) == 0:
@@ -183,7 +214,7 @@ def format_who_when(fields):
     else:
         sep = b' '
 
-    return b'%s%s<%s> %d %s%02d%02d' % (name.encode('utf-8'), sep, fields[1].encode("ascii"), fields[2], offset_sign, offset_hours, offset_minutes)
+    return (b'%s%s<%s> ' % (name.encode('utf-8'), sep, email.encode("ascii")), b' %s%02d%02d' % (offset_sign, offset_hours, offset_minutes))
 
 def format_property(name, value):
     """Format the name and value (both unicode) of a property as a string."""
@@ -196,11 +227,6 @@ def format_property(name, value):
         result = b"property %s" % utf8_name
     return result
 
-def serialize_mark(stream, id):
-    """Writes a mark command to the stream."""
-
-    stream.write(b"mark %s\n" % format_mark(id))
-
 class BlobFragmentIterator(object):
     """Helper class for blob data that is fragmented into multiple blocks."""
 
@@ -211,22 +237,41 @@ class BlobFragmentIterator(object):
     def __len__(self):
         return self.size
 
+def format_data(value):
+    """Format a data command for a bytes object."""
+
+    return b"data %d\n%s\n" % (len(value), value)
+
 def serialize_data(stream, value):
     """Writes a data command to the stream. The given value can either be a bytes object, or
     a BlobFragmentIterator class."""
 
-    stream.write(b"data %d\n" % len(value))
-
     if isinstance(value, bytes):
-        stream.write(value)
-    elif isinstance(value, BlobFragmentIterator):
-        cnt = len(value)
-        for b in value.iterator:
-            cnt -= len(b)
-            stream.write(b)
-        if cnt:
-            raise Exception("fragmented blob length mismatch (declared: {}, effective: {})".format(len(value), len(value) - cnt))
-    else:
+        stream.write(format_data(value))
+        return
+
+    if not isinstance(value, BlobFragmentIterator):
         raise Exception("unexpected value type {}".format(type(value)))
 
-    stream.write(b"\n")
+    # small fragments are coalesced into larger blocks before writing them out, large ones are
+    # written as they are
+    buf = bytearray(b"data %d\n" % len(value))
+    cnt = len(value)
+    for b in value.iterator:
+        cnt -= len(b)
+        if len(b) >= fragment_coalesce_size:
+            if buf:
+                stream.write(buf)
+                buf = bytearray()
+            stream.write(b)
+            continue
+
+        buf += b
+        if len(buf) >= fragment_coalesce_size:
+            stream.write(buf)
+            buf = bytearray()
+    if cnt:
+        raise Exception("fragmented blob length mismatch (declared: {}, effective: {})".format(len(value), len(value) - cnt))
+
+    buf += b"\n"
+    stream.write(buf)
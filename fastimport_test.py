@@ -0,0 +1,102 @@
+﻿import fastimport
+import io
+import unittest
+
+class SerializationTests(unittest.TestCase):
+
+    def test_commit(self):
+        cmd = fastimport.CommitCommand("master", 100, None, ("John Doe", "jd@example.org", 0, 3600), "msg", merges = [b":99"])
+
+        self.assertEqual(
+            b"commit refs/heads/master\n"
+            b"mark :100\n"
+            b"committer John Doe <jd@example.org> 0 +0100\n"
+            b"data 3\nmsg\n"
+            b"merge :99\n",
+            self.serialize(cmd))
+
+    def test_commit_properties(self):
+        cmd = fastimport.CommitCommand("master", 100, None, ("John Doe", "jd@example.org", 0, 3600), "msg", properties = {"b": "xyz", "a": None})
+
+        self.assertEqual(
+            b"commit refs/heads/master\n"
+            b"mark :100\n"
+            b"committer John Doe <jd@example.org> 0 +0100\n"
+            b"data 3\nmsg\n"
+            b"property a\n"
+            b"property b 3 xyz\n",
+            self.serialize(cmd))
+
+    def test_file_modify_fragmented(self):
+        data = fastimport.BlobFragmentIterator(5, [b"ab", b"cde"])
+        cmd = fastimport.FileModifyCommand("a b/c", 0o644, None, data)
+
+        self.assertEqual(b"M 644 inline a b/c\ndata 5\nabcde\n", self.serialize(cmd))
+
+    def test_serialize_data_coalescing(self):
+        writes = []
+
+        class Stream(object):
+            def write(self, data):
+                writes.append(bytes(data))
+
+        saved = fastimport.fragment_coalesce_size
+        fastimport.fragment_coalesce_size = 8
+        try:
+            fastimport.serialize_data(Stream(), fastimport.BlobFragmentIterator(9, [b"abc", b"def", b"ghi"]))
+        finally:
+            fastimport.fragment_coalesce_size = saved
+
+        self.assertEqual([b"data 9\nabc", b"defghi\n"], writes)
+
+    def test_serialize_data_large_fragments(self):
+        writes = []
+
+        class Stream(object):
+            def write(self, data):
+                writes.append(bytes(data))
+
+        saved = fastimport.fragment_coalesce_size
+        fastimport.fragment_coalesce_size = 4
+        try:
+            fastimport.serialize_data(Stream(), fastimport.BlobFragmentIterator(10, [b"abcd", b"efghij"]))
+            fastimport.serialize_data(Stream(), fastimport.BlobFragmentIterator(6, [b"ab", b"c", b"def"]))
+        finally:
+            fastimport.fragment_coalesce_size = saved
+
+        self.assertEqual([b"data 10\n", b"abcd", b"efghij", b"\n", b"data 6\nab", b"cdef", b"\n"], writes)
+
+    def test_file_modify_length_mismatch(self):
+        data = fastimport.BlobFragmentIterator(6, [b"ab", b"cde"])
+        cmd = fastimport.FileModifyCommand("a", 0o644, None, data)
+
+        self.assertRaises(Exception, lambda: self.serialize(cmd))
+
+    def test_check_path(self):
+        self.assertEqual("a", fastimport.check_path("a"))
+
+        for p in (None, "", "/a"):
+            self.assertRaises(ValueError, lambda: fastimport.check_path(p))
+
+    def test_format_who_when(self):
+        self.assertEqual(b"A <a@b> 1000 -0130", fastimport.format_who_when(("A", "a@b", 1000, -5400)))
+        self.assertEqual(b"A <a@b> 2000 -0130", fastimport.format_who_when(("A", "a@b", 2000, -5400)))
+        self.assertEqual(b"<a@b> 3000 +0000", fastimport.format_who_when(("", "a@b", 3000, 0)))
+
+        self.assertRaises(ValueError, lambda: fastimport.format_who_when(("A ", "a@b", 0, 0)))
+
+    def test_format_path(self):
+        self.assertEqual(b"a b", fastimport.format_path("a b"))
+        self.assertEqual(b'"a b"', fastimport.format_path("a b", quote_spaces = True))
+        self.assertEqual(b'"a\\nb"', fastimport.format_path("a\nb"))
+        self.assertEqual(b'""a"', fastimport.format_path('"a'))
+        self.assertEqual("ä".encode("utf-8"), fastimport.format_path("ä"))
+
+    @staticmethod
+    def serialize(cmd):
+        stream = io.BytesIO()
+        cmd.serialize(stream)
+        return stream.getvalue()
+
+if __name__ == '__main__':
+    unittest.main(verbosity = 2)
\ No newline at end of file
@@ -2,8 +2,10 @@ import argparse
 import fastimport
 import importlib
 import io
+import queue
 import sys
 import tfsdb
+import threading
 
 # Helper Methods
 # --------------
@@ -13,20 +15,21 @@ class WarningsCollector(object):
     def __init__(self, to_stderr = True, to_file = None):
         self.to_stderr = to_stderr
         self.to_file = to_file
-        self.lines = []
+
+        # warnings are streamed to the file, so we neither accumulate them nor lose them on a crash
+        self.file = io.open(to_file, "wt", encoding = "utf-8-sig", buffering = 64 * 1024) if to_file else None
 
     def add(self, line):
-        if self.to_file:
-            self.lines.append(line)
+        if self.file:
+            self.file.write(line)
+            self.file.write('\n')
         if self.to_stderr:
             print(line, file = sys.stderr)
 
     def close(self):
-        if self.to_file:
-            with io.open(self.to_file, "wt", encoding = "utf-8-sig") as f:
-                for l in self.lines:
-                    f.write(l)
-                    f.write('\n')
+        if self.file:
+            self.file.close()
+            self.file = None
 
     def __enter__(self):
         return self
@@ -34,11 +37,105 @@ class WarningsCollector(object):
     def __exit__(self, type, value, traceback):
         self.close()
 
+class CommitBatch(object):
+    """Accumulates the serialized commands of a commit in memory and passes them on to the
+    inner stream in a single write. Very large commits are passed on in blocks of :limit: bytes.
+    Writes of at least :direct_size: bytes (i.e. blob content) are passed on without copying."""
+
+    def __init__(self, inner, limit = 4 * 1024 * 1024, direct_size = 64 * 1024):
+        self.inner = inner
+        self.limit = limit
+        self.direct_size = direct_size
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        if len(data) >= self.direct_size:
+            self.pass_on()
+            self.inner.write(data)
+            return
+
+        self.buffer.write(data)
+        if self.buffer.tell() >= self.limit:
+            self.pass_on()
+
+    def pass_on(self):
+        """Writes the accumulated data to the inner stream."""
+
+        if self.buffer.tell():
+            # the data is handed over, so the inner stream may keep it
+            self.inner.write(self.buffer.getvalue())
+            self.buffer = io.BytesIO()
+
+    def flush(self):
+        self.pass_on()
+        self.inner.flush()
+
+_stop_writing = object()
+
+class BackgroundWriter(object):
+    """Writes to the inner stream on a separate thread, so that reading from the TFS database goes on
+    while the consumer (e.g. git fast-import) is busy. At most :max_pending: blocks are queued.
+
+    Call :close: before closing or detaching the inner stream."""
+
+    def __init__(self, inner, max_pending = 8):
+        self.inner = inner
+        self.queue = queue.Queue(max_pending)
+        self.error = None
+
+        self.thread = threading.Thread(target = self._run, daemon = True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            data = self.queue.get()
+            try:
+                if data is _stop_writing:
+                    return
+                if self.error is None:
+                    if data is None:
+                        self.inner.flush()
+                    else:
+                        self.inner.write(data)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _raise_pending_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def write(self, data):
+        self._raise_pending_error()
+        self.queue.put(data) # the caller must not modify the data afterwards
+
+    def flush(self):
+        self.queue.put(None)
+        self.queue.join()
+        self._raise_pending_error()
+
+    def close(self):
+        """Writes out all queued blocks and stops the writer thread. Write errors are not raised
+        here, but by :write: and :flush:."""
+
+        if self.thread is not None:
+            self.queue.put(_stop_writing)
+            self.thread.join()
+            self.thread = None
+
+_stdout_wrapped = False
+
 def register_unicode_fallback_on_stdout():
     """Changes unicode mode as we do not want to crash on unprintable file names."""
 
+    global _stdout_wrapped
+    if _stdout_wrapped:
+        return
+
     inner = sys.stdout
-    sys.stdout = io.TextIOWrapper(inner.buffer, inner.encoding, 'replace', line_buffering = inner.line_buffering)
+    sys.stdout = io.TextIOWrapper(inner.buffer, inner.encoding, 'replace', line_buffering = inner.line_buffering, write_through = True)
+    _stdout_wrapped = True
 
 # Commands
 # --------
@@ -109,20 +206,50 @@ def cmd_list_users(repo, show_ids = False):
 
         print(line)
 
-def cmd_fastexport(repo, dry_run = False, stop_after = 0, no_tags = False, no_content = False):
+def cmd_fastexport(repo, dry_run = False, stop_after = 0, no_tags = False, no_content = False, no_md5_check = False):
 
     class NullStream(object):
         def write(self, data):
             pass
 
-    stream = sys.stdout.buffer if not dry_run else NullStream()
+        def pass_on(self):
+            pass
 
-    for cmd in tfsdb.fastexport_commands(repo, stop_after, no_tags, no_content):
-        cmd.serialize(stream)
+        def flush(self):
+            pass
 
-        # print feedback
-        if dry_run and isinstance(cmd, fastimport.ProgressCommand):
-            print(cmd.message)
+    # coalesce the many small writes of the individual commands into larger blocks, and write them
+    # out in the background
+    out = io.BufferedWriter(sys.stdout.buffer, buffer_size = 1024 * 1024) if not dry_run else None
+    writer = BackgroundWriter(out) if out is not None else None
+    stream = CommitBatch(writer) if writer is not None else NullStream()
+
+    completed = False
+    try:
+        for cmd in tfsdb.fastexport_commands(repo, stop_after, no_tags, no_content, no_md5_check):
+            # pass on complete commits
+            if isinstance(cmd, fastimport.CommitCommand):
+                stream.pass_on()
+
+            cmd.serialize(stream)
+
+            # print feedback
+            if dry_run and isinstance(cmd, fastimport.ProgressCommand):
+                print(cmd.message)
+
+        stream.flush()
+        completed = True
+    finally:
+        if writer is not None:
+            writer.close()
+
+            # the wrapper would otherwise close stdout when being garbage collected
+            try:
+                out.detach()
+            except Exception:
+                if completed:
+                    raise
+                # otherwise the original exception is the relevant one
 
 # Main
 # ----
@@ -156,8 +283,9 @@ if __name__ == '__main__':
     p1.add_argument("--stop-after", type=int, help="stop export after changeset N", metavar="N")
     p1.add_argument("--no-tags", action="store_true", help="do not export any tags")
     p1.add_argument("--no-content", action="store_true", help="does not export file content but only writes empty files")
+    p1.add_argument("--no-md5-check", action="store_true", help="does not verify the file content against the MD5 checksums stored in TFS (faster, but decompression errors go unnoticed)")
     p1.add_argument("--export-warnings", dest="warnings", type=str, help="dumps all warnings during fast export into a file")
-    p1.set_defaults(handler = lambda repo, args: cmd_fastexport(repo, args.dry_run, args.stop_after, args.no_tags, args.no_content))
+    p1.set_defaults(handler = lambda repo, args: cmd_fastexport(repo, args.dry_run, args.stop_after, args.no_tags, args.no_content, args.no_md5_check))
 
     input = sys.argv[1:]
     if len(input) < 2:
@@ -180,7 +308,7 @@ if __name__ == '__main__':
 
     # main
     with WarningsCollector(to_file = warning_file) as warnings:
-        hooks = tfsdb.ExporterHooks(config.branch_extract, config.file_filter, config.content_rewrite, config.user_lookup, warnings.add)
+        hooks = tfsdb.ExporterHooks(config.branch_extract, config.file_filter, config.content_rewrite, config.user_lookup, warnings.add, getattr(config, "path_prefixes", None))
 
         with tfsdb.create_repo(config.conninfo, hooks, temp_dir) as repo:
             args.handler(repo, args)
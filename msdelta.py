@@ -57,6 +57,20 @@ _deltaFree.argtypes = [LPBUFFER]
 _deltaFree.errcheck = _winerror_on_failure
 
 
+def _input_buffer(data):
+    """Exposes the buffer of a bytes object without copying it. The callee must not modify the content."""
+
+    return ctypes.cast(ctypes.c_char_p(data), LPBUFFER)
+
+def _take_output(output):
+    """Copies the content of a delta output into a bytes object and frees the native buffer."""
+
+    result = ctypes.string_at(output.lpStart, output.uSize)
+    _deltaFree(output.lpStart)
+
+    return result
+
+
 # Public interface
 # ----------------
 
@@ -65,10 +79,8 @@ MagicNumber = b'PA19'
 def CreateDeltaB(source, target, fileTypeSet = DELTA_FILE_TYPE_SET_RAW_ONLY, set_flags = DELTA_FLAG_NONE, reset_flags = DELTA_FLAG_NONE):
     """Creates a delta based on in-memory buffers."""
     
-    # TODO: not sure about how many copies acutally are done in memory...
-
-    diSource = DELTA_INPUT(ctypes.create_string_buffer(source), len(source), False)
-    diTarget = DELTA_INPUT(ctypes.create_string_buffer(target), len(target), False)
+    diSource = DELTA_INPUT(_input_buffer(source), len(source), False)
+    diTarget = DELTA_INPUT(_input_buffer(target), len(target), False)
     diEmpty = DELTA_INPUT(None, 0, False)
     doResult = DELTA_OUTPUT()
 
@@ -79,26 +91,18 @@ def CreateDeltaB(source, target, fileTypeSet = DELTA_FILE_TYPE_SET_RAW_ONLY, set
         0,
         ctypes.byref(doResult))
 
-    result = doResult.lpStart[:doResult.uSize]
-    _deltaFree(doResult.lpStart)
-
-    return result
+    return _take_output(doResult)
 
 def ApplyDeltaB(source, delta, flags = DELTA_APPLY_FLAG_ALLOW_PA19):
     """Applies a delta based on in-memory buffers."""
 
-    # TODO: not sure about how many copies are actually being created...
-
-    diSource = DELTA_INPUT(ctypes.create_string_buffer(source), len(source), False)
-    diDelta = DELTA_INPUT(ctypes.create_string_buffer(delta), len(delta), False)    
+    diSource = DELTA_INPUT(_input_buffer(source), len(source), False)
+    diDelta = DELTA_INPUT(_input_buffer(delta), len(delta), False)
     doResult = DELTA_OUTPUT()
 
     _applyDeltaB(flags, diSource, diDelta, ctypes.byref(doResult))
 
-    result = doResult.lpStart[:doResult.uSize]
-    _deltaFree(doResult.lpStart)
-
-    return result
+    return _take_output(doResult)
 
 def ApplyDelta(sourcePath, deltaPath, targetPath, flags = DELTA_APPLY_FLAG_ALLOW_PA19):
     """Applies a delta based on file content."""
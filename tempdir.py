@@ -1,14 +1,18 @@
+import collections
 import io
 import os
 import shutil
 import tempfile
 import time
+import zlib
 
 class TempDir(object):
     """Specific temporary directory implementation with helper methods suited
     for the TFS fast exporter."""
 
-    def __init__(self, location = None, clear_location_if_existing = False):
+    path_cache_size = 10000
+
+    def __init__(self, location = None, clear_location_if_existing = False, precreate_subdirs = False):
         if location:
             # cleanup
             if os.path.exists(location):
@@ -24,7 +28,12 @@ class TempDir(object):
             location = tempfile.mkdtemp()
 
         self.location = location
-        self.subdirs = {}
+        self.subdirs = [None] * 256
+
+        if precreate_subdirs:
+            for i in range(256):
+                self._create_subdir(i)
+        self.paths = collections.OrderedDict()
 
     def cleanup(self):
         shutil.rmtree(self.location)
@@ -38,22 +47,38 @@ class TempDir(object):
     def get_path(self, name):
         """Creates from the given name a storage location."""
 
+        path = self.paths.get(name)
+        if path is not None:
+            self.paths.move_to_end(name)
+            return path
+
+        key = name
         if not isinstance(name, str):
             name = str(name)
         if '..' in name:
             raise Exception("name '{}' must not contain parent dir navigation".format(name))
 
-        subdir_key = hash(name) % 256
+        subdir_key = zlib.crc32(name.encode("utf-8")) & 0xFF # stable across processes, in contrast to hash()
 
-        if subdir_key in self.subdirs:
-            subdir_path = self.subdirs[subdir_key]
-        else:
-            subdir_path = os.path.join(self.location, "{:02X}".format(subdir_key))
-            
-            os.mkdir(subdir_path)
-            self.subdirs[subdir_key] = subdir_path
+        subdir_path = self.subdirs[subdir_key] or self._create_subdir(subdir_key)
+
+        path = os.path.join(subdir_path, name)
+
+        # remember recently used paths, as every file is typically accessed several times in a row (the
+        # least recently used one is evicted)
+        self.paths[key] = path
+        if len(self.paths) > self.path_cache_size:
+            self.paths.popitem(last = False)
+
+        return path
+
+    def _create_subdir(self, subdir_key):
+        subdir_path = os.path.join(self.location, "{:02X}".format(subdir_key))
+
+        os.mkdir(subdir_path)
+        self.subdirs[subdir_key] = subdir_path
 
-        return os.path.join(subdir_path, name)
+        return subdir_path
 
     def exists(self, name):
         """Indicates whether the given file exists or not."""
@@ -65,10 +90,10 @@ class TempDir(object):
 
         path = self.get_path(name)
 
-        with io.open(path, 'wb') as f:
+        with io.open(path, 'wb', buffering = 1024 * 1024) as f:
             if content:
                 if isinstance(content, bytes):
-                    f.writelines(content)
+                    f.write(content)
                 else:
                     for b in content:
                         f.write(b)
@@ -80,7 +105,8 @@ class TempDir(object):
 
         path = self.get_path(name)
 
-        with io.open(path, "rb") as f:
+        # unbuffered, as we are reading large blocks anyway
+        with io.open(path, "rb", buffering = 0) as f:
             while True:
                 block = f.read(block_size)
                 if not block:
@@ -17,6 +17,13 @@ class TempDirTests(unittest.TestCase):
 
         self.assertEqual(False, os.path.exists(".td-test"))
 
+    def test_precreate_subdirs(self):
+        with tempdir.TempDir(precreate_subdirs = True) as td:
+            self.assertEqual(256, len(os.listdir(td.location)))
+
+            td.create("a")
+            self.assertTrue(td.exists("a"))
+
     def test_create_exists(self):
         with tempdir.TempDir() as td:
             self.assertFalse(td.exists("a"))
@@ -24,6 +31,25 @@ class TempDirTests(unittest.TestCase):
             td.create("a")
             self.assertTrue(td.exists("a"))
 
+    def test_create_read_roundtrip(self):
+        with tempdir.TempDir() as td:
+            td.create("a", b"abcde")
+            self.assertEqual([b"abc", b"de"], list(td.read("a", block_size = 3)))
+
+            td.create("b", [b"ab", b"cde"])
+            self.assertEqual([b"abcde"], list(td.read("b")))
+
+    def test_path_cache_evicts_least_recently_used(self):
+        with tempdir.TempDir() as td:
+            td.path_cache_size = 2
+
+            td.get_path("a")
+            td.get_path("b")
+            td.get_path("a") # "b" is now the least recently used one
+            td.get_path("c")
+
+            self.assertEqual(["a", "c"], list(td.paths))
+
     def test_read_delete_at_end(self):
         with tempdir.TempDir() as td:
             td.create("a")
@@ -37,5 +63,11 @@ class TempDirTests(unittest.TestCase):
                 pass
             self.assertFalse(td.exists("a"))
 
+    def test_get_path_stable(self):
+        with tempdir.TempDir() as td:
+            path = td.get_path(12345)
+
+            self.assertEqual(os.path.join(td.location, "1C", "12345"), path)
+
 if __name__ == '__main__':
     unittest.main(verbosity = 2)
\ No newline at end of file
@@ -9,8 +9,17 @@ import msdelta
 import tempdir
 import zlib
 
+try:
+    # ISA-L decompresses GZIP streams considerably faster than zlib (optional)
+    from isal import isal_zlib as gzip_zlib
+except ImportError:
+    gzip_zlib = zlib
+
 msdelta_decompress_on_disk_threshold = 10000000
 oversize_warning_limit = 10000000
+select_batch_size = 1000
+changeset_window_size = 100
+md5_upfront_limit = 1024 * 1024
 
 # Tools
 # -----
@@ -23,12 +32,17 @@ def make_iterable(value):
 
     return iter(value)
 
+_nothing_peeked = object()
+
 class PeekableIterator(object):
     """An itertator that allows peeking at the next object without actually consuming it."""
 
+    __slots__ = ("iter", "_next", "_peeked")
+
     def __init__(self, coll_or_iter):
         self.iter = make_iterable(coll_or_iter)
-        self._peeked = []
+        self._next = self.iter.__next__
+        self._peeked = _nothing_peeked
 
     def __iter__(self):
         return self
@@ -37,35 +51,50 @@ class PeekableIterator(object):
         """Returns the next element to be iterated over. Raises a StopIteration exception
         if there is no next element."""
 
-        if not self._peeked:
-            self._peeked.append(next(self.iter))
+        value = self._peeked
+        if value is _nothing_peeked:
+            value = self._peeked = self._next()
 
-        return self._peeked[0]
+        return value
 
     def __next__(self):
-        if self._peeked:
-            return self._peeked.pop(0)
-        else:
-            return next(self.iter)
+        value = self._peeked
+        if value is _nothing_peeked:
+            return self._next()
+
+        self._peeked = _nothing_peeked
+        return value
 
-def build_keyed_dict(items, key_extractor, value_transformer = None):
-    """Groups a list of items by keys as returned by the key extractor function."""
+def rebuffer(blockiter, size = 128 * 1024):
+    """Coalesces a sequence of bytes instances into blocks of at least :size: bytes (except
+    for the last block). Blocks that are already large enough are passed on as they are."""
 
-    tmp = collections.defaultdict(list)
-    for i in items:
-        tmp[key_extractor(i)].append(value_transformer(i) if value_transformer else i)
-    return tmp
+    buf = bytearray()
+    for b in blockiter:
+        if not buf and len(b) >= size:
+            yield b
+            continue
+
+        buf += b
+        if len(buf) >= size:
+            yield bytes(buf)
+            buf = bytearray()
+
+    if buf:
+        yield bytes(buf)
+
+def select(conn, query, *args, batch_size = None, **kwargs):
+    """Helper method to easily use the ADODBAPI to select one ore more records.
 
-def select(conn, query, *args, **kwargs):
-    """Helper method to easily use the ADODBAPI to select one ore more records"""
+    Records are fetched in batches. Use a small :batch_size: for queries returning content blocks."""
 
     with conn.cursor() as cur:
         cur.execute(query, *args, **kwargs)
         while True:
-            row = cur.fetchone()
-            if not row:
-                break;
-            yield row
+            rows = cur.fetchmany(batch_size or select_batch_size)
+            if not rows:
+                break
+            yield from rows
 
 def selectone(conn, query, *args, **kwargs):
     """Helper method to easily use the ADODBAPI when exactly a single record is expected"""
@@ -82,6 +111,25 @@ def selectone(conn, query, *args, **kwargs):
 
     return result
 
+def take_rows(rows, key_extractor, key):
+    """Takes all rows with the given key from the start of a PeekableIterator over rows sorted
+    by that key. Leading rows with smaller keys are skipped."""
+
+    result = []
+    try:
+        while True:
+            k = key_extractor(rows.peek())
+            if k > key:
+                break
+
+            row = next(rows)
+            if k == key:
+                result.append(row)
+    except StopIteration:
+        pass
+
+    return result
+
 # TFS Utils
 # ---------
 
@@ -95,6 +143,19 @@ def tfs_unmangle_path(path):
 
     return tmp
 
+def tfs_path_prefix_condition(column, prefixes):
+    """Returns an SQL condition and its parameters restricting the given (mangled) path column to paths
+    starting with one of the given (unmangled) prefixes. TFS' path mangling removes the LIKE wildcards
+    from path names, so only '[' needs escaping."""
+
+    if not prefixes:
+        return "1=1", []
+
+    condition = "(" + " or ".join("{} like ?".format(column) for p in prefixes) + ")"
+    params = [p.replace("_", ">").replace("-", '"').replace("%", "|").replace("[", "[[]") + "%" for p in prefixes]
+
+    return condition, params
+
 def tfs_unmangle_timestamp(ts):
     # TFS timestamps are UTC
     return ts.replace(tzinfo = datetime.timezone.utc)
@@ -102,34 +163,59 @@ def tfs_unmangle_timestamp(ts):
 def tfs_decompress(compression_type, blockiter):
     """Decompresses a blob series."""
 
+    # single blocks stay in a list, so MD5ValidatingIterator can hash them in one go
+    if isinstance(blockiter, list) and len(blockiter) == 1:
+        if compression_type == 0:
+            return blockiter
+        if compression_type == 1:
+            return [gzip_zlib.decompress(blockiter[0], zlib.MAX_WBITS | 16)]
+
     if compression_type == 0: # uncompressed
-        return blockiter
+        return rebuffer(blockiter)
 
     if compression_type == 1: # GZIP
-        # see http://stackoverflow.com/questions/2423866/python-decompressing-gzip-chunk-by-chunk
-        d = zlib.decompressobj(zlib.MAX_WBITS | 16)
-
-        return (d.decompress(b) for b in blockiter)
+        return rebuffer(_gzip_decompress(blockiter))
 
     raise Exception("unexpected compression type {}".format(compression_type))
 
+def _gzip_decompress(blockiter):
+    blockiter = iter(blockiter)
+    first = next(blockiter, None)
+    if first is None:
+        return
+
+    # most contents consist of a single block, which is decompressed in one shot
+    second = next(blockiter, None)
+    if second is None:
+        yield gzip_zlib.decompress(first, zlib.MAX_WBITS | 16)
+        return
+
+    # see http://stackoverflow.com/questions/2423866/python-decompressing-gzip-chunk-by-chunk
+    d = gzip_zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+    yield d.decompress(first)
+    yield d.decompress(second)
+    for b in blockiter:
+        yield d.decompress(b)
+
 # Internal object model
 # ---------------------
 
-RowRelPath = collections.namedtuple("RowRelPath", ["row", "relpath"])
-
 def split_and_filter_file_rows(rows, hooks, full_path_hook = lambda row: row.FullPath, return_rel_paths = True):
+    """Splits rows up by branch and drops the ones filtered out by the hooks. The rows of each branch
+    are returned as (row, relpath) tuples, or as plain rows if :return_rel_paths: is not set."""
+
     result = collections.defaultdict(list)
 
-    branch_extract = hooks.branch_extract
+    branch_extract = hooks.branch_extract_tfs_path
     file_filter = hooks.file_filter
 
     for row in rows:
-        branch, relpath = branch_extract(tfs_unmangle_path(full_path_hook(row)))
+        branch, relpath = branch_extract(full_path_hook(row))
         if not branch or (relpath and not file_filter(branch, relpath)):
             continue
 
-        result[branch].append(RowRelPath(row, relpath) if return_rel_paths else row)
+        result[branch].append((row, relpath) if return_rel_paths else row)
 
     return result
 
@@ -138,26 +224,52 @@ class MD5ValidatingIterator(object):
     the MD5 checksum. At the end of the iteration, compares that sum with
     the checksum given in the constructor."""
 
+    __slots__ = ("expected_checksum", "iter", "context", "hashed_upfront", "running_checksum", "_next", "_update")
+
     def __init__(self, checksum, coll_or_iter, context = None):
         self.expected_checksum = checksum
         self.iter = make_iterable(coll_or_iter)
         self.context = context
 
-        self.running_checksum = hashlib.md5()
+        # small contents that are already in memory are hashed in one go
+        self.hashed_upfront = isinstance(coll_or_iter, list) and sum(len(b) for b in coll_or_iter) <= md5_upfront_limit
+        self.running_checksum = hashlib.md5(b"".join(coll_or_iter)) if self.hashed_upfront else hashlib.md5()
+
+        # bound methods, looked up once instead of per block
+        self._next = self.iter.__next__
+        self._update = None if self.hashed_upfront else self.running_checksum.update
 
     def __iter__(self):
         return self
 
     def __next__(self):
         try:
-            tmp = next(self.iter)
-            self.running_checksum.update(tmp)
+            tmp = self._next()
+            if self._update:
+                self._update(tmp)
             return tmp
         except StopIteration:
             if self.running_checksum.digest() != self.expected_checksum:
                 raise Exception("checksum mismatch (in context: {})".format(self.context))
             raise
 
+    def drain(self):
+        """Consumes all remaining blocks (and validates the checksum) without keeping them."""
+
+        collections.deque(self, maxlen = 0)
+
+def md5_file_digest(path):
+    """Calculates the MD5 checksum of a file."""
+
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"): # Python 3.11+
+            return hashlib.file_digest(f, "md5").digest()
+
+        md5 = hashlib.md5()
+        for b in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(b)
+        return md5.digest()
+
 class FileOperation(object):
     """Represents a file operation inside of a single commit."""
 
@@ -179,28 +291,36 @@ class FileContentChange(FileOperation):
         self.content_hash = content_hash
         self.content_blocks_cb = content_blocks_cb
 
-    def content(self):
-        """Returns the file content in byte blocks"""
+    def content(self, validate_md5 = True):
+        """Returns the file content in byte blocks. The MD5 checksum stored in TFS is only checked
+        if :validate_md5: is set."""
 
         # see also:
         # http://stackoverflow.com/questions/834118/how-do-you-get-a-file-out-of-the-tbl-content-table-in-tfs
 
         # deltification
         if self.content_type == 1: # full text
-            blocks = tfs_decompress(self.compression_type, self.content_blocks_cb())
+            blocks = tfs_decompress(self.compression_type, self.content_blocks_cb(self.id))
+            if not validate_md5:
+                return blocks
+
+            # conssitency check (to see whether we got the decompression right)
+            return MD5ValidatingIterator(self.content_hash, blocks, context = self.id)
 
         elif self.content_type == 2: # MSDelta
             if not self.tempdir.exists(self.id):
                 self._unpack_deltas_to_tempdir()
 
-            blocks = self.tempdir.read(self.id, delete_at_end = True)
+            # consistency check (to see whether we got the undeltification right), done on the
+            # file as a whole before streaming anything
+            if validate_md5 and md5_file_digest(self.tempdir.get_path(self.id)) != self.content_hash:
+                raise Exception("checksum mismatch (in context: {})".format(self.id))
+
+            return self.tempdir.read(self.id, delete_at_end = True)
 
         else:
             raise Exception("unexpected content type {} for file {}".format(self.content_type, self.id))
 
-        # conssitency check (to see whether we got the decompression / undeltification right)
-        return MD5ValidatingIterator(self.content_hash, blocks, context = self.id)
-
     def _unpack_deltas_to_tempdir(self):
         # TFS seems to store the latest version as full dump and older versions as backwards diff.
         # There are entries with VersionFrom equals to NULL. They have to be ignored.
@@ -217,39 +337,43 @@ class FileContentChange(FileOperation):
                 and f1.VersionFrom is not NULL
             where f0.FileId = ?
             order by f1.FileId desc, c.OffsetFrom""",
-            [self.id])
+            [self.id], batch_size = 1)
 
         rowsByFileId = itertools.groupby(rows, lambda r: r.FileId)
 
-        if self.file_length > msdelta_decompress_on_disk_threshold:
-            # patching is disk based
-            deltaBase = None
-            for fileId, fileRows in rowsByFileId:
-                fileRows = PeekableIterator(fileRows)
-                compression_type = fileRows.peek().CompressionType
-
-                if deltaBase is None:
-                    deltaBase = self.tempdir.create(fileId, tfs_decompress(compression_type, (r.Content for r in fileRows)))
-                else:
-                    newFile = self.tempdir.get_path(fileId)
-                    fdelta = self.tempdir.create("delta", (r.Content for r in fileRows))
-
-                    msdelta.ApplyDelta(deltaBase, fdelta, newFile)
-                    deltaBase = newFile
-        else:
-            # memory based (but still save the versions to disk, for further use)
-            deltaBase = None
-            for fileId, fileRows in rowsByFileId:
-                fileRows = PeekableIterator(fileRows)
-                compression_type = fileRows.peek().CompressionType
+        # patching is memory based (but still saves the versions to disk, for further use) as long
+        # as all versions involved are small. Otherwise, it is disk based, so that neither the base
+        # versions nor the deltas are ever materialized in memory.
+        on_disk = self.file_length > msdelta_decompress_on_disk_threshold
+
+        deltaBase = None # content (memory based) or file path (disk based) of the previous version
+        deltaBaseId = None
+        for fileId, fileRows in rowsByFileId:
+            firstRow = next(fileRows)
+            contents = itertools.chain((firstRow.Content,), (r.Content for r in fileRows))
+
+            if not on_disk and firstRow.FileLength > msdelta_decompress_on_disk_threshold:
+                # switch to disk based patching
+                on_disk = True
+                if deltaBase is not None:
+                    deltaBase = self.tempdir.get_path(deltaBaseId) if self.tempdir.exists(deltaBaseId) else self.tempdir.create(deltaBaseId, [deltaBase])
+
+            if deltaBase is None:
+                blocks = tfs_decompress(firstRow.CompressionType, contents)
+                deltaBase = self.tempdir.create(fileId, blocks) if on_disk else b''.join(blocks)
+            elif on_disk:
+                newFile = self.tempdir.get_path(fileId)
+                fdelta = self.tempdir.create("delta", contents)
+
+                msdelta.ApplyDelta(deltaBase, fdelta, newFile)
+                deltaBase = newFile
+            else:
+                delta = b''.join(contents)
+                deltaBase = msdelta.ApplyDeltaB(deltaBase, delta)
 
-                if deltaBase is None:
-                    deltaBase = b''.join(tfs_decompress(compression_type, (r.Content for r in fileRows)))
-                else:
-                    delta = b''.join(r.Content for r in fileRows)
-                    deltaBase = msdelta.ApplyDeltaB(deltaBase, delta)
+                self.tempdir.create(fileId, [deltaBase])
 
-                    self.tempdir.create(fileId, [deltaBase])
+            deltaBaseId = fileId
 
 class User(object):
     """Represents an user identity."""
@@ -311,18 +435,26 @@ class Changeset(object):
     #   2048        rename
 
     @staticmethod
-    def filerowsRelpathsByBranch(id, conn, hooks):
-        """Selects all file rows of a single TFS commit and splits them up into
-        all configures GIT branches."""
+    def selectFilerows(conn, hooks, first_id, last_id):
+        """Selects the file rows of all TFS commits from :first_id: to :last_id: in a single query, ordered 
+        by commit. Use :filerowsRelpathsByBranch: to pick the rows of the individual commits."""
+
+        prefix_condition, prefix_params = tfs_path_prefix_condition("v.FullPath", hooks.path_prefixes)
 
-        filerows = select(conn, """
+        return PeekableIterator(select(conn, """
             select *
             from tbl_Version v
             inner join tbl_File f on f.FileId = v.FileId
-            where v.VersionFrom=? and v.FileId is not NULL""", 
-            [id])
+            where v.VersionFrom between ? and ? and v.FileId is not NULL and {}
+            order by v.VersionFrom""".format(prefix_condition), 
+            [first_id, last_id] + prefix_params))
+
+    @staticmethod
+    def filerowsRelpathsByBranch(id, filerows, hooks):
+        """Takes the file rows of a single TFS commit from the rows selected by :selectFilerows: 
+        and splits them up into all configures GIT branches. Commits have to be processed in order."""
 
-        return split_and_filter_file_rows(filerows, hooks)
+        return split_and_filter_file_rows(take_rows(filerows, lambda r: r.VersionFrom, id), hooks)
 
     @staticmethod
     def mergeRowsByTargetBranch(id, conn, hooks):
@@ -332,6 +464,8 @@ class Changeset(object):
         # see: http://netexp.blogspot.ch/2012/11/tfs-who-is-father-of-my-branch.html
         # see: https://social.msdn.microsoft.com/Forums/vstudio/en-US/a010da85-39f7-4810-99fc-c33db4800c8f/tfs-11-starting-point-of-a-branch?forum=tfsversioncontrol
 
+        prefix_condition, prefix_params = tfs_path_prefix_condition("tv.FullPath", hooks.path_prefixes)
+
         mergerows = select(conn, """
             select mh.*, tv.FullPath as TargetFullPath, sv.FullPath as SourceFullPath
 
@@ -346,8 +480,9 @@ class Changeset(object):
                 and mh.SourceVersionFrom < mh.TargetVersionFrom -- a sign of history loss/rewrite?
             where 
                 ForwardMerge = 1 and RenameHistory != 1 -- merges, but no renames (which also show up in this table)
-                and mh.TargetVersionFrom = ?""",
-            [id])
+                and mh.TargetVersionFrom = ?
+                and {}""".format(prefix_condition),
+            [id] + prefix_params)
 
         return split_and_filter_file_rows(mergerows, hooks, return_rel_paths = False, full_path_hook = lambda row: row.TargetFullPath)
 
@@ -366,23 +501,34 @@ class Changeset(object):
         self.rowsRelPaths = filerowsRelPaths
         self.mergerows = mergerows
 
-    @functools.lru_cache()
+        self._first_content_rows = None
+
     def first_content_row_by_file_id(self):
         """Returns a dictionary with the first tbl_Content row per file id and an additional column 'HasMoreBlocks'."""
 
+        # cached on the instance (and not in a global LRU cache, which would keep the content of 
+        # already exported changesets alive)
+        if self._first_content_rows is not None:
+            return self._first_content_rows
+
         # tbl_content:
         #  * file content is junked to 1MB blocks appearing in multiple rows.
 
         rows = select(self.conn, 
             """select 
                 c.*, 
-                (case when exists(select null from tbl_Content c1 where c1.FileId = c.FileId and c1.OffsetFrom <> 0) then 1 else 0 end) as HasMoreBlocks
+                (case when b.BlockCount > 1 then 1 else 0 end) as HasMoreBlocks
             from tbl_Content c 
-            inner join tbl_Version v on v.FileId = c.FileId 
-            where v.VersionFrom = ? and c.OffsetFrom = 0""", 
+            inner join (
+                select c1.FileId, count(*) as BlockCount
+                from tbl_Content c1
+                where c1.FileId in (select v.FileId from tbl_Version v where v.VersionFrom = ?)
+                group by c1.FileId) b on b.FileId = c.FileId
+            where c.OffsetFrom = 0""", 
             [self.id])
 
-        return {r.FileId:r for r in rows}
+        self._first_content_rows = {r.FileId:r for r in rows}
+        return self._first_content_rows
 
     def _content_blocks_for_file(self, file_id):
         """Returns an iterator over all content blocks of a given file."""
@@ -392,11 +538,13 @@ class Changeset(object):
         if not row.HasMoreBlocks:
             return [row.Content]
         else:
-            return (r.Content for r in select(self.conn, "select Content from tbl_Content where FileId = ? order by OffsetFrom", [file_id]))
+            return (r.Content for r in select(self.conn, "select Content from tbl_Content where FileId = ? order by OffsetFrom", [file_id], batch_size = 1))
 
     def changes(self):
         """Returns an iterator over :FileContentChange: instances."""
 
+        content_blocks_for_file = self._content_blocks_for_file # looked up by file id, no per-row closure
+
         for row, relpath in self.rowsRelPaths:
             if row.DeletionId or not row.FileId:
                 continue
@@ -408,7 +556,7 @@ class Changeset(object):
             # can choose to supply all revisions of that file as a sequence of consecutive blob commands. This allows fast-import 
             # to deltify the different file revisions against each other, saving space in the final packfile.
 
-            yield FileContentChange(self.conn, self.tempdir, row.FileId, relpath, row.FileLength, row.CompressedLength, row.CompressionType, row.ContentType, row.HashValue, lambda row=row: self._content_blocks_for_file(row.FileId))
+            yield FileContentChange(self.conn, self.tempdir, row.FileId, relpath, row.FileLength, row.CompressedLength, row.CompressionType, row.ContentType, row.HashValue, content_blocks_for_file)
 
     def deletes(self):
         """Returns an interator over :FileOperation: instances."""
@@ -448,14 +596,27 @@ class ExporterHooks(object):
     For the description of the individual function signatures, please look at cfg-empty.py.
     
     The warning hook is invoked with a string argument to indicate an unexpected
-    conversion situation."""
+    conversion situation.
+
+    The optional path prefixes restrict all file queries to TFS paths starting with one of
+    them. This filter is applied by the database server."""
     
-    def __init__(self, branch_extract, file_filter, content_rewrite, user_lookup, warning):
+    def __init__(self, branch_extract, file_filter, content_rewrite, user_lookup, warning, path_prefixes = None):
         self.branch_extract = branch_extract
         self.file_filter = file_filter
         self.content_rewrite = content_rewrite
         self.user_lookup = user_lookup
         self.warning = warning
+        self.path_prefixes = path_prefixes
+
+        # the same paths show up over and over again across changesets (cache per hooks object)
+        self.branch_extract_tfs_path = functools.lru_cache(maxsize = 128 * 1024)(self._branch_extract_tfs_path)
+
+    def _branch_extract_tfs_path(self, path):
+        """Unmangles the given TFS path and applies the branch extraction hook. Use the cached
+        :branch_extract_tfs_path: instead."""
+
+        return self.branch_extract(tfs_unmangle_path(path))
 
 BranchesInfo = collections.namedtuple("BranchesInfo", ["names", "unassigned", "assigned_by_branch", "ignored_by_branch", "oversized_by_branch"])
 
@@ -469,7 +630,7 @@ class Repository10(object):
 
         try:
             self.conn = adodbapi.connect(conninfo)
-            self.tempdir = tempdir.TempDir(temp_dir or "fe_tmp_swit", clear_location_if_existing = True) # "_swit" extension to exclude it from our McAfee
+            self.tempdir = tempdir.TempDir(temp_dir or "fe_tmp_swit", clear_location_if_existing = True, precreate_subdirs = True) # "_swit" extension to exclude it from our McAfee
         except:
             self.cleanup()
             raise
@@ -523,39 +684,53 @@ class Repository10(object):
         
         returns a BranchesInfo object"""
 
+        prefix_condition, prefix_params = tfs_path_prefix_condition("v.FullPath", self.hooks.path_prefixes)
+
         rows = select(self.conn, """
             select distinct v.FullPath, f.FileLength
             from tbl_Version v
-            inner join tbl_File f on v.FileId = f.FileId""")
-
-        # branch names, files outside of a branch (branch_extract hook)
-        rowsWithBranchAndLocalPath = ((r, self.hooks.branch_extract(tfs_unmangle_path(r.FullPath))) for r in rows)
-        rowsWithLocalPathByBranch = build_keyed_dict(rowsWithBranchAndLocalPath, lambda i: i[1][0], lambda i: (i[0], i[1][1]))
-
-        unassigned = sorted({tfs_unmangle_path(i[0].FullPath) for i in rowsWithLocalPathByBranch[None]})
-        rowsWithLocalPathByBranch.pop(None)
-
-        names = sorted(rowsWithLocalPathByBranch.keys())
+            inner join tbl_File f on v.FileId = f.FileId
+            where {}""".format(prefix_condition),
+            prefix_params)
+
+        branch_extract = self.hooks.branch_extract_tfs_path
+        file_filter = self.hooks.file_filter
+
+        branches = set()
+        unassigned = set()
+        assigned = collections.defaultdict(set)
+        ignored = collections.defaultdict(set)
+        oversized = collections.defaultdict(set)
+
+        for r in rows:
+            # branch names, files outside of a branch (branch_extract hook)
+            branch, relpath = branch_extract(r.FullPath)
+            if branch is None:
+                unassigned.add(r.FullPath)
+                continue
 
-        # ignored files within a branch (file_filter hook)
-        assigned_by_branch = {}
-        ignored_by_branch = {}
+            branches.add(branch)
 
-        for branch in rowsWithLocalPathByBranch:
-            rowsWithLocalPath = rowsWithLocalPathByBranch[branch]
+            # ignored files within a branch (file_filter hook)
+            if relpath and not file_filter(branch, relpath):
+                ignored[branch].add(relpath)
+                continue
 
-            tmp = build_keyed_dict(rowsWithLocalPath, lambda i: (not i[1]) or self.hooks.file_filter(branch, i[1]))
+            assigned[branch].add(relpath)
 
-            rowsWithLocalPathByBranch[branch] = tmp[True]
+            # oversized files
+            if r.FileLength > oversize_warning_limit:
+                oversized[branch].add(relpath)
 
-            assigned_by_branch[branch] = sorted({i[1] for i in tmp[True]})
-            ignored_by_branch[branch] = sorted({i[1] for i in tmp[False]})
+        names = sorted(branches)
 
-        # oversized files
-        oversized_by_branch = {b:sorted({i[1] for i in items if i[0].FileLength > oversize_warning_limit}) for b, items in rowsWithLocalPathByBranch.items()}
-       
         # done
-        return BranchesInfo(names, unassigned, assigned_by_branch, ignored_by_branch, oversized_by_branch)
+        return BranchesInfo(
+            names,
+            sorted({tfs_unmangle_path(p) for p in unassigned}),
+            {b:sorted(assigned.get(b, ())) for b in names},
+            {b:sorted(ignored.get(b, ())) for b in names},
+            {b:sorted(oversized.get(b, ())) for b in names})
 
     def changesets(self):
         """Iterates over all existing changesets in the form of Changeset objects."""
@@ -565,26 +740,35 @@ class Repository10(object):
         csrows = select(self.conn, """
             select 
                 cs.*, 
-                case when exists(select null from tbl_MergeHistory mh where mh.TargetVersionFrom = cs.ChangeSetId) then 1 else 0 end as MayHaveMerges
+                case when mh.TargetVersionFrom is null then 0 else 1 end as MayHaveMerges
             from tbl_ChangeSet cs
+            left join (select distinct TargetVersionFrom from tbl_MergeHistory) mh on mh.TargetVersionFrom = cs.ChangeSetId
             where cs.Comment != ?
             order by cs.ChangeSetId""", 
             ['All of the changes in this changeset have been destroyed.'])
 
-        for csrow in csrows:
-            filerowRelpathsByBranch = Changeset.filerowsRelpathsByBranch(csrow.ChangeSetId, self.conn, self.hooks)
-            mergerowsByTargetBranch = Changeset.mergeRowsByTargetBranch(csrow.ChangeSetId, self.conn, self.hooks) if csrow.MayHaveMerges else {}
-
-            for branch, filerowsRelpaths in filerowRelpathsByBranch.items():
-                yield Changeset(self.conn, self.tempdir, self.hooks, 
-                                csrow.ChangeSetId, 
-                                self.get_user(csrow.OwnerId), 
-                                tfs_unmangle_timestamp(csrow.CreationDate),
-                                csrow.Comment, 
-                                self.get_user(csrow.CommitterId), 
-                                branch, 
-                                filerowsRelpaths, 
-                                mergerowsByTargetBranch.get(branch, []))
+        while True:
+            # file rows are queried for a window of changesets at once, instead of per changeset
+            window = list(itertools.islice(csrows, changeset_window_size))
+            if not window:
+                break
+
+            filerows = Changeset.selectFilerows(self.conn, self.hooks, window[0].ChangeSetId, window[-1].ChangeSetId)
+
+            for csrow in window:
+                filerowRelpathsByBranch = Changeset.filerowsRelpathsByBranch(csrow.ChangeSetId, filerows, self.hooks)
+                mergerowsByTargetBranch = Changeset.mergeRowsByTargetBranch(csrow.ChangeSetId, self.conn, self.hooks) if csrow.MayHaveMerges else {}
+
+                for branch, filerowsRelpaths in filerowRelpathsByBranch.items():
+                    yield Changeset(self.conn, self.tempdir, self.hooks, 
+                                    csrow.ChangeSetId, 
+                                    self.get_user(csrow.OwnerId), 
+                                    tfs_unmangle_timestamp(csrow.CreationDate),
+                                    csrow.Comment, 
+                                    self.get_user(csrow.CommitterId), 
+                                    branch, 
+                                    filerowsRelpaths, 
+                                    mergerowsByTargetBranch.get(branch, []))
 
     def labels(self):
         """Iterates over all existing labels. Returns Label objects. 
@@ -593,11 +777,15 @@ class Repository10(object):
 
         labelRows = {r.Labelid:r for r in select(self.conn, "select * from tbl_label")}
 
+        prefix_condition, prefix_params = tfs_path_prefix_condition("v.FullPath", self.hooks.path_prefixes)
+
         entryRows = select(self.conn, """
             select le.*, v.FullPath
             from tbl_LabelEntry le
             inner join tbl_Version v on v.ItemId = le.ItemId and le.VersionFrom between v.VersionFrom and v.VersionTo
-            order by le.LabelId""")
+            where {}
+            order by le.LabelId""".format(prefix_condition),
+            prefix_params)
 
         # split branches and filter files
         entryRowsRelpathsByBranch = split_and_filter_file_rows(entryRows, self.hooks)
@@ -659,7 +847,7 @@ def git_mangle_tagname(name):
     # see: http://git-scm.com/docs/git-check-ref-format
     return git_mangle_path(name).replace("\n", "").replace("\r", "").replace("[", "(").replace("]", ")").replace(" ", "_")
 
-def fastexport_commands(repo, stop_after = 0, skip_tags = False, no_content = False):
+def fastexport_commands(repo, stop_after = 0, skip_tags = False, no_content = False, no_md5_check = False):
     """Produces a stream of fastexport commands that can then be serialized."""
 
     # Mark generation
@@ -691,7 +879,9 @@ def fastexport_commands(repo, stop_after = 0, skip_tags = False, no_content = Fa
 
         dn, email, tz = repo.get_user_displayname_email_timezone(user)
 
-        return (dn, email, date.astimezone(datetime.timezone.utc).timestamp(), int(date.astimezone(tz).utcoffset().total_seconds()))
+        # TFS timestamps are timezone aware (UTC), so no conversion is needed for the epoch seconds. The offset
+        # is not cached per day, as it changes in the middle of DST transition days.
+        return (dn, email, date.timestamp(), int(date.astimezone(tz).utcoffset().total_seconds()))
 
     for cs in repo.changesets():
         if stop_after and cs.id > stop_after:
@@ -721,7 +911,7 @@ def fastexport_commands(repo, stop_after = 0, skip_tags = False, no_content = Fa
             if no_content:
                 length, content = 0, [b'']
             else:
-                length, content = f.file_length, f.content()
+                length, content = f.file_length, f.content(validate_md5 = not no_md5_check)
 
                 if repo.hooks.content_rewrite:
                     length, content = repo.hooks.content_rewrite(cs.branch, f.fullpath, length, content)
@@ -1,4 +1,8 @@
-﻿import hashlib
+﻿import collections
+import datetime
+import gzip
+import hashlib
+import tempdir
 import tfsdb
 import unittest
 
@@ -22,6 +26,141 @@ class PeekableIteratorTests(unittest.TestCase):
     def test_iterable(self):
         list(tfsdb.PeekableIterator([11])) # should not fail
 
+class TakeRowsTests(unittest.TestCase):
+
+    def test_take_rows(self):
+        rows = tfsdb.PeekableIterator([1, 3, 3, 4, 6])
+
+        self.assertEqual([3, 3], tfsdb.take_rows(rows, lambda r: r, 3))
+        self.assertEqual([], tfsdb.take_rows(rows, lambda r: r, 5)) # skips 4
+        self.assertEqual([6], tfsdb.take_rows(rows, lambda r: r, 6))
+        self.assertEqual([], tfsdb.take_rows(rows, lambda r: r, 7))
+
+class RepositoryChangesetsTests(unittest.TestCase):
+
+    ChangesetRow = collections.namedtuple("ChangesetRow", ["ChangeSetId", "OwnerId", "CommitterId", "CreationDate", "Comment", "MayHaveMerges"])
+    FileRow = collections.namedtuple("FileRow", ["VersionFrom", "FullPath", "FileId"])
+    IdentityRow = collections.namedtuple("IdentityRow", ["DomainPart", "NamePart", "DisplayPart"])
+
+    class FakeConnection(object):
+        """Answers the queries of Repository10.changesets() from in-memory rows."""
+
+        def __init__(self, changesets, filerows):
+            self.changesets = changesets
+            self.filerows = filerows
+            self.filerow_ranges = []
+
+        def cursor(self):
+            return RepositoryChangesetsTests.FakeCursor(self)
+
+    class FakeCursor(object):
+
+        def __init__(self, conn):
+            self.conn = conn
+            self.rows = []
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, type, value, traceback):
+            pass
+
+        def execute(self, query, params = []):
+            if "from tbl_ChangeSet cs" in query:
+                self.rows = list(self.conn.changesets)
+            elif "from tbl_Version v" in query:
+                first, last = params[0], params[1]
+                self.conn.filerow_ranges.append((first, last))
+                self.rows = [r for r in self.conn.filerows if first <= r.VersionFrom <= last]
+            elif "from Constants c" in query:
+                self.rows = [RepositoryChangesetsTests.IdentityRow("DOM", "user{}".format(params[0]), "User")]
+            else:
+                raise Exception("unexpected query")
+
+        def fetchmany(self, size):
+            result, self.rows = self.rows[:size], self.rows[size:]
+            return result
+
+    def test_changesets(self):
+        date = datetime.datetime(2015, 1, 1)
+        changesets = [self.ChangesetRow(id, 1, 1, date, "cs{}".format(id), 0) for id in [1, 2, 4, 5, 7]]
+        filerows = [
+            self.FileRow(1, "$\\main\\a.txt", 10),
+            self.FileRow(2, "$\\main\\b.txt", 11),
+            self.FileRow(2, "$\\dev\\b.txt", 12),
+            self.FileRow(3, "$\\main\\destroyed.txt", 13), # changeset not listed
+            self.FileRow(5, "$\\main\\c.txt", 14),
+            self.FileRow(7, "$\\main\\d.txt", 15)]
+
+        conn = self.FakeConnection(changesets, filerows)
+        hooks = tfsdb.ExporterHooks(lambda path: path[2:].partition("\\")[::2], lambda branch, relpath: True, None, None, None)
+
+        repo = tfsdb.Repository10.__new__(tfsdb.Repository10)
+        repo.conn = conn
+        repo.hooks = hooks
+        repo.tempdir = None
+
+        saved = tfsdb.changeset_window_size
+        tfsdb.changeset_window_size = 2
+        try:
+            result = [(cs.id, cs.branch, [relpath for row, relpath in cs.rowsRelPaths]) for cs in repo.changesets()]
+        finally:
+            tfsdb.changeset_window_size = saved
+
+        self.assertEqual([
+            (1, "main", ["a.txt"]),
+            (2, "main", ["b.txt"]),
+            (2, "dev", ["b.txt"]),
+            (5, "main", ["c.txt"]),
+            (7, "main", ["d.txt"])], result)
+        self.assertEqual([(1, 2), (4, 5), (7, 7)], conn.filerow_ranges)
+
+class RebufferTests(unittest.TestCase):
+
+    def test_rebuffer(self):
+        self.assertEqual([b"abc", b"defg", b"h"], list(tfsdb.rebuffer([b"a", b"bc", b"defg", b"", b"h"], size = 3)))
+        self.assertEqual([], list(tfsdb.rebuffer([b""], size = 3)))
+
+class TfsDecompressTests(unittest.TestCase):
+
+    def test_gzip(self):
+        c = b"0123456789" * 1000
+        z = gzip.compress(c)
+
+        self.assertEqual(c, b"".join(tfsdb.tfs_decompress(1, [z])))
+        self.assertEqual(c, b"".join(tfsdb.tfs_decompress(1, [z[:10], z[10:100], z[100:]])))
+        self.assertEqual([], list(tfsdb.tfs_decompress(1, [])))
+
+class TfsUtilsTests(unittest.TestCase):
+
+    def test_tfs_unmangle_path(self):
+        self.assertEqual('$\\a_b-c%d', tfsdb.tfs_unmangle_path('$\\a>b"c|d\\'))
+
+    def test_tfs_path_prefix_condition(self):
+        self.assertEqual(("1=1", []), tfsdb.tfs_path_prefix_condition("v.FullPath", None))
+
+        self.assertEqual(
+            ("(v.FullPath like ? or v.FullPath like ?)", ['$\\a>b"c|d\\%', '$\\[[]x]%']),
+            tfsdb.tfs_path_prefix_condition("v.FullPath", ['$\\a_b-c%d\\', '$\\[x]']))
+
+class ExporterHooksTests(unittest.TestCase):
+
+    def test_branch_extract_cache_per_instance(self):
+        calls = []
+
+        def branch_extract(path):
+            calls.append(path)
+            return path.partition("\\")[::2]
+
+        hooks1 = tfsdb.ExporterHooks(branch_extract, None, None, None, None)
+        hooks2 = tfsdb.ExporterHooks(lambda path: ("other", path), None, None, None, None)
+
+        self.assertEqual(("a", "b_c"), hooks1.branch_extract_tfs_path("a\\b>c\\"))
+        self.assertEqual(("a", "b_c"), hooks1.branch_extract_tfs_path("a\\b>c\\"))
+        self.assertEqual(["a\\b_c"], calls)
+
+        self.assertEqual(("other", "a\\b_c"), hooks2.branch_extract_tfs_path("a\\b>c\\"))
+
 class MD5ValidatingIteratorTest(unittest.TestCase):
 
     def test_check_success_and_mismatch(self):
@@ -29,14 +168,36 @@ class MD5ValidatingIteratorTest(unittest.TestCase):
         h = self.calc_hash(c)
 
         # run against correct checksum
-        list(tfsdb.MD5ValidatingIterator(h, [c])) # should not fail
+        tfsdb.MD5ValidatingIterator(h, [c]).drain() # should not fail
 
         # run against modified checksum
         with self.assertRaises(Exception) as cm:
-            list(tfsdb.MD5ValidatingIterator(h + b'--', [c]))
+            tfsdb.MD5ValidatingIterator(h + b'--', [c]).drain()
 
         self.assertTrue('checksum' in str(cm.exception))
 
+    def test_check_iterator(self):
+        c = [b'123', b'45']
+        h = self.calc_hash(b''.join(c))
+
+        self.assertEqual(c, list(tfsdb.MD5ValidatingIterator(h, iter(c))))
+        with self.assertRaises(Exception):
+            list(tfsdb.MD5ValidatingIterator(h + b'--', iter(c)))
+
+    def test_md5_file_digest(self):
+        with tempdir.TempDir() as td:
+            path = td.create("a", b"12345")
+
+            self.assertEqual(self.calc_hash(b"12345"), tfsdb.md5_file_digest(path))
+
+    def test_content_validate_md5(self):
+        c = b'12345'
+        change = tfsdb.FileContentChange(None, None, 1, "a.txt", len(c), len(c), 0, 1, self.calc_hash(c) + b'--', lambda id: [c])
+
+        self.assertEqual(c, b''.join(change.content(validate_md5 = False)))
+        with self.assertRaises(Exception):
+            b''.join(change.content())
+
     @staticmethod
     def calc_hash(content):
         return hashlib.md5(content).digest()
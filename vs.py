@@ -1,21 +1,87 @@
 ﻿"Holds common configuration content for all VisualStudio projects."""
 
-import re
+import functools
 
 # https://social.msdn.microsoft.com/Forums/vstudio/en-US/9920911d-1a7e-4ada-90cd-b1b910586cf4/why-do-you-need-the-vspscc-and-vssscc-files?forum=tfsgeneral
-_vs_ignores_re = re.compile(r"\.vs[sp]scc\Z")
+_vs_actions_by_extension = {"vssscc": "ignore", "vspscc": "ignore", "sln": "rewrite"}
+
+_vs_sln_scc_section_header = b"GlobalSection(TeamFoundationVersionControl)"
+_vs_sln_section_end = b"EndGlobalSection"
+_vs_whitespace = b" \t\n\r\f\v"
+
+@functools.lru_cache(maxsize = 64 * 1024) # both hooks ask for the same paths again and again
+def vs_classify(relpath):
+    """Classifies a relative path by its extension (case insensitive). Returns "ignore" for Visual Studio
+    Source Code Control files, "rewrite" for solution files and "keep" for everything else."""
+
+    _, dot, ext = relpath.rpartition(".")
+    if not dot or len(ext) > 6: # no extension, or longer than any known one (no need to lowercase it)
+        return "keep"
+
+    return _vs_actions_by_extension.get(ext.lower(), "keep")
 
 def vs_file_filter(branch, relpath):
     """Returns False if the given relative path is a Visual Studio Source Code Control file."""
 
-    return not _vs_ignores_re.search(relpath)
+    return vs_classify(relpath) != "ignore"
+
+def _blocks_contain(blocks, needle):
+    """Searches a list of bytes blocks for the needle, including occurrences spanning block boundaries."""
+
+    overlap = len(needle) - 1
+    tail = b""
+    for b in blocks:
+        if needle in b or needle in tail + b[:overlap]:
+            return True
+        tail = (tail + b[-overlap:])[-overlap:]
+
+    return False
+
+def _remove_scc_sections(data):
+    """Removes all source control sections (including the preceding whitespace) from the content of a
+    solution file. Same as replacing r'\s+GlobalSection\(TeamFoundationVersionControl\).*?EndGlobalSection'
+    by nothing, but with plain substring searches."""
+
+    parts = []
+    pos = 0 # end of the last removed section
+    search = 0
+    while True:
+        idx = data.find(_vs_sln_scc_section_header, search)
+        if idx < 0:
+            break
+
+        start = idx
+        while start > pos and data[start - 1] in _vs_whitespace:
+            start -= 1
+        if start == idx: # not preceded by whitespace
+            search = idx + 1
+            continue
+
+        end = data.find(_vs_sln_section_end, idx + len(_vs_sln_scc_section_header))
+        if end < 0:
+            break
+
+        parts.append(data[pos:start])
+        pos = search = end + len(_vs_sln_section_end)
+
+    if not parts:
+        return data
+
+    parts.append(data[pos:])
+    return b"".join(parts)
 
 def vs_content_rewrite(branch, relpath, length, blocks):
     """if the given file is a Visual Studio solution file, removes the source control provider section from that file."""
 
-    if relpath.lower().endswith(".sln"):
-        data = b"".join(blocks)
-        data = re.sub(br'\s+GlobalSection\(TeamFoundationVersionControl\).*?EndGlobalSection', b'', data, flags = re.DOTALL)
+    if vs_classify(relpath) == "rewrite":
+        blocks = list(blocks)
+
+        # cheap literal search first, most solution files do not contain the section (any more) and are
+        # passed on without joining the blocks
+        if not _blocks_contain(blocks, _vs_sln_scc_section_header):
+            return length, blocks
+
+        data = _remove_scc_sections(b"".join(blocks))
         return len(data), [data]
 
     return length, blocks
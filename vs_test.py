@@ -0,0 +1,65 @@
+import unittest
+import vs
+
+class VsContentRewriteTests(unittest.TestCase):
+
+    sln = (b"Global\r\n"
+           b"\tGlobalSection(TeamFoundationVersionControl) = preSolution\r\n"
+           b"\t\tSccNumberOfProjects = 1\r\n"
+           b"\tEndGlobalSection\r\n"
+           b"\tGlobalSection(SolutionProperties) = preSolution\r\n"
+           b"\t\tHideSolutionNode = FALSE\r\n"
+           b"\tEndGlobalSection\r\n"
+           b"EndGlobal\r\n")
+
+    expected = (b"Global\r\n"
+                b"\tGlobalSection(SolutionProperties) = preSolution\r\n"
+                b"\t\tHideSolutionNode = FALSE\r\n"
+                b"\tEndGlobalSection\r\n"
+                b"EndGlobal\r\n")
+
+    def test_removes_scc_section(self):
+        length, blocks = vs.vs_content_rewrite("b", "a/Test.SLN", len(self.sln), [self.sln[:30], self.sln[30:]])
+
+        self.assertEqual(self.expected, b"".join(blocks))
+        self.assertEqual(len(self.expected), length)
+
+    def test_removes_scc_section_spanning_blocks(self):
+        for i in range(1, len(self.sln)):
+            length, blocks = vs.vs_content_rewrite("b", "a/test.sln", len(self.sln), iter([self.sln[:i], self.sln[i:i + 3], self.sln[i + 3:]]))
+
+            self.assertEqual(self.expected, b"".join(blocks))
+
+    def test_keeps_other_files(self):
+        length, blocks = vs.vs_content_rewrite("b", "a/test.txt", len(self.sln), [self.sln])
+
+        self.assertEqual(self.sln, b"".join(blocks))
+        self.assertEqual(len(self.sln), length)
+
+    def test_keeps_solution_without_scc_section(self):
+        length, blocks = vs.vs_content_rewrite("b", "a/test.sln", len(self.expected), [self.expected[:10], self.expected[10:]])
+
+        self.assertEqual(self.expected, b"".join(blocks))
+        self.assertEqual(len(self.expected), length)
+
+class VsClassifyTests(unittest.TestCase):
+
+    def test_classify(self):
+        self.assertEqual("rewrite", vs.vs_classify("a/Test.Sln"))
+        self.assertEqual("ignore", vs.vs_classify("a/Test.VSSSCC"))
+        self.assertEqual("keep", vs.vs_classify("a/test.cs"))
+        self.assertEqual("keep", vs.vs_classify("a.sln/readme"))
+        self.assertEqual("keep", vs.vs_classify("a/makefile"))
+        self.assertEqual("keep", vs.vs_classify("vssscc"))
+        self.assertEqual("keep", vs.vs_classify("vspscc"))
+        self.assertEqual("keep", vs.vs_classify("sln"))
+
+class VsFileFilterTests(unittest.TestCase):
+
+    def test_filter(self):
+        self.assertTrue(vs.vs_file_filter("b", "a/test.sln"))
+        self.assertFalse(vs.vs_file_filter("b", "a/test.vssscc"))
+        self.assertFalse(vs.vs_file_filter("b", "a/test.csproj.vspscc"))
+
+if __name__ == '__main__':
+    unittest.main(verbosity = 2)